@@ -3,71 +3,126 @@
 Fix issues introduced by the first batch fix script
 """
 
+import mmap
 import os
 import re
-import glob
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+_MIN_PARALLEL_FILES = 8
+
+_RE_DUP_ACCESS = re.compile(rb'Accessibility\s*=\s*"public",\s*Accessibility\s*=\s*"public",')
+_RE_DOUBLE_ASYNC = re.compile(rb'((?:Unregister|Unload|Load|Run|Validate)Analyzer)Async(?:Async)+')
+_RE_VERSION = re.compile(rb'(\.Version\s*\)\s*)\.Returns\("([^"]+)"\)')
+
 def fix_duplicate_accessibility(content):
     """Fix duplicate Accessibility properties"""
     # Replace duplicate Accessibility initializations
-    pattern = r'Accessibility\s*=\s*"public",\s*Accessibility\s*=\s*"public",'
-    replacement = 'Accessibility = "public",'
-    return re.sub(pattern, replacement, content)
+    return _RE_DUP_ACCESS.sub(b'Accessibility = "public",', content)
 
 def fix_async_suffix_issues(content):
     """Fix double Async suffix issues"""
-    content = content.replace('LoadAnalyzerAsyncAsync', 'LoadAnalyzerAsync')
-    content = content.replace('UnloadAnalyzerAsyncAsync', 'UnloadAnalyzerAsync')
-    content = content.replace('RunAnalyzerAsyncAsync', 'RunAnalyzerAsync')
-    content = content.replace('ValidateAnalyzerAsyncAsync', 'ValidateAnalyzerAsync')
-    content = content.replace('UnregisterAnalyzerAsyncAsync', 'UnregisterAnalyzerAsync')
-    return content
+    return _RE_DOUBLE_ASYNC.sub(rb'\1Async', content)
 
 def fix_error_message_message(content):
     """Fix ErrorMessageMessage typo"""
-    return content.replace('ErrorMessageMessage', 'ErrorMessage')
+    return content.replace(b'ErrorMessageMessage', b'ErrorMessage')
 
 def fix_version_property(content):
     """Fix Version property to return System.Version"""
-    pattern = r'(\.Version\s*\)\s*\.Returns\("([^"]+)"\)'
-    replacement = r'\1.Returns(new Version("\2"))'
-    return re.sub(pattern, replacement, content)
+    return _RE_VERSION.sub(rb'\1.Returns(new Version("\2"))', content)
+
+# Each fixer paired with a substring that must be present for it to change anything
+_FIXERS = (
+    (b'Accessibility', fix_duplicate_accessibility),
+    (b'AsyncAsync', fix_async_suffix_issues),
+    (b'ErrorMessageMessage', fix_error_message_message),
+    (b'.Version', fix_version_property),
+)
+
+def _walk_cs(root):
+    """Yield the path of every .cs file under root"""
+    if not os.path.isdir(root):
+        return
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith('.cs'):
+                    yield entry.path
+
+def _write_atomic(filepath, content):
+    """Replace filepath with content without ever leaving it half-written"""
+    tmp_path = f"{filepath}.tmp.{os.getpid()}"
+    try:
+        # One large buffered write, then an atomic rename over the original
+        with open(tmp_path, 'wb', buffering=1 << 20) as f:
+            f.write(content)
+        shutil.copymode(filepath, tmp_path)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _process_one(filepath):
+    """Fix a single test file, returning True if it was rewritten"""
+    try:
+        # C# sources are rewritten as raw bytes; none of the fixes need decoded text.
+        # Scan the page cache through mmap first, so files without any trigger
+        # substring are never copied into memory (mmap's 'in' only tests single
+        # bytes, hence find())
+        with open(filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return False
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if not any(mapped.find(trigger) != -1 for trigger, _ in _FIXERS):
+                    return False
+                content = mapped[:]
+
+        original_content = content
+
+        # Apply fixes, skipping any whose trigger substring is absent
+        for trigger, fixer in _FIXERS:
+            if trigger in content:
+                content = fixer(content)
+
+        # Write back if changed. re.sub and bytes.replace hand back the same
+        # object when nothing matched, so the identity test settles the common
+        # no-op case without comparing the whole buffer
+        if content is not original_content and content != original_content:
+            _write_atomic(filepath, content)
+            return True
+
+    except Exception as e:
+        print(f"Error processing {filepath}: {e}")
+
+    return False
 
 def main():
     print("Fixing issues from batch fix...")
 
     # Find all C# test files
-    test_files = []
-    for pattern in ['tests/**/*.cs', 'tests\\**\\*.cs']:
-        test_files.extend(glob.glob(pattern, recursive=True))
+    test_files = list(_walk_cs('tests'))
 
     print(f"Found {len(test_files)} test files")
 
-    fixed_count = 0
-
-    for filepath in test_files:
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
+    # Files are independent, so spread the regex work across processes;
+    # for a handful of files the pool startup costs more than it saves
+    if len(test_files) < _MIN_PARALLEL_FILES:
+        results = [_process_one(filepath) for filepath in test_files]
+    else:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = list(executor.map(_process_one, test_files, chunksize=16))
 
-            original_content = content
-
-            # Apply fixes
-            content = fix_duplicate_accessibility(content)
-            content = fix_async_suffix_issues(content)
-            content = fix_error_message_message(content)
-            content = fix_version_property(content)
-
-            # Write back if changed
-            if content != original_content:
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                fixed_count += 1
-                print(f"Fixed: {filepath}")
-
-        except Exception as e:
-            print(f"Error processing {filepath}: {e}")
+    fixed_count = 0
+    for filepath, fixed in zip(test_files, results):
+        if fixed:
+            fixed_count += 1
+            print(f"Fixed: {filepath}")
 
     print(f"\nFixed issues in {fixed_count} files.")
 
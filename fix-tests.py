@@ -3,138 +3,195 @@
 Batch fix script for MCPsharp test compilation errors
 """
 
+import mmap
 import os
 import re
-import glob
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def fix_list_length_to_count(content):
-    """Fix List.Length to List.Count"""
-    return re.sub(r'(\w+)\.Length', r'\1.Count', content)
-
-def fix_is_analyzer_loaded(content):
-    """Fix IsAnalyzerLoaded to GetAnalyzer != null"""
-    content = re.sub(r'(\w+)\.IsAnalyzerLoaded\(([^)]+)\)', r'\1.GetAnalyzer(\2) != null', content)
-    content = re.sub(r'IsAnalyzerLoaded\(([^)]+)\)', r'GetAnalyzer(\1) != null', content)
-    return content
+_MIN_PARALLEL_FILES = 8
+
+# All independent rewrites in a single alternation so each file is scanned once
+_RE_FIXES = re.compile(
+    rb'(?P<length>(?<=\w)\.Length)'
+    rb'|(?P<isload>IsAnalyzerLoaded\((?P<isload_arg>[^)]+)\))'
+    rb'|(?P<error>\.Error\b)'
+    rb'|(?P<registry>\.(?:Unregister|Unload|Load|Run|Validate)Analyzer\b)'
+    rb'|(?P<method_name>result\.MethodName)'
+    rb'|(?P<containing_type>result\.ContainingType)'
+    rb'|(?P<method_sig>Name\s*=\s*"[^"]+",\s*ContainingType\s*=\s*"[^"]+",\s*ReturnType\s*=\s*"[^"]+",)'
+    rb'|(?P<sec_val>new SecurityValidationResult\(\s*\{\s*IsValid\s*=\s*true\s*\})'
+    rb'|(?P<proc_file>(?P<proc_target>\w+)\.ProcessFileAsync\((?P<proc_arg>[^,]+),\s*[^)]+\))'
+)
+
+# Substrings at least one of which must be present for _RE_FIXES to match
+_FIX_TRIGGERS = (
+    b'.Length', b'IsAnalyzerLoaded', b'.Error',
+    b'.UnregisterAnalyzer', b'.UnloadAnalyzer', b'.LoadAnalyzer', b'.RunAnalyzer', b'.ValidateAnalyzer',
+    b'result.MethodName', b'ContainingType', b'new SecurityValidationResult', b'.ProcessFileAsync',
+)
+
+# Types that need an extra using directive when referenced
+_USING_TRIGGERS = (
+    b'CallerResult', b'CallType', b'ConfidenceLevel',
+    b'StreamProcessRequest', b'StreamProcessorType',
+    b'AnalyzerLoadResult', b'IAnalyzerRegistry',
+)
+
+_RE_MODELS_USING = re.compile(rb'^[ \t]*using MCPsharp\.Models;[^\r\n]*(\r?\n|\Z)', re.MULTILINE)
+_RE_MODELS_SUB_USING = re.compile(rb'^[ \t]*using [^\r\n]*MCPsharp\.Models\.(Roslyn|Streaming|Analyzers)', re.MULTILINE)
+
+_SEC_VAL_REPLACEMENT = b'new SecurityValidationResult { IsValid = true, IsSigned = false, IsTrusted = false, HasMaliciousPatterns = false }'
+
+def _dispatch_fix(match):
+    """Return the rewrite for whichever fix matched"""
+    kind = match.lastgroup
+    if kind == 'length':
+        # Fix List.Length to List.Count
+        return b'.Count'
+    if kind == 'isload':
+        # Fix IsAnalyzerLoaded to GetAnalyzer != null
+        return b'GetAnalyzer(' + apply_fixes(match.group('isload_arg')) + b') != null'
+    if kind == 'error':
+        # Fix result.Error to result.ErrorMessage
+        return b'.ErrorMessage'
+    if kind == 'registry':
+        # Fix analyzer registry method calls; the word boundary leaves names
+        # that already end in Async alone, so re-running cannot double the suffix
+        return match.group(0) + b'Async'
+    if kind == 'method_name':
+        # Fix CallerResult property accesses
+        return b'result.TargetSignature.Name'
+    if kind == 'containing_type':
+        return b'result.TargetSignature.ContainingType'
+    if kind == 'method_sig':
+        # Add Accessibility property to MethodSignature if missing
+        return match.group(0) + b'\n                Accessibility = "public",'
+    if kind == 'sec_val':
+        return _SEC_VAL_REPLACEMENT
+    # Fix ProcessFileAsync calls that still have old signature
+    return match.group('proc_target') + b'.ProcessFileAsync(' + apply_fixes(match.group('proc_arg')) + b')'
 
-def fix_error_property(content):
-    """Fix result.Error to result.ErrorMessage"""
-    return content.replace('.Error', '.ErrorMessage')
+def apply_fixes(content):
+    """Apply every independent rewrite in one pass over the content"""
+    return _RE_FIXES.sub(_dispatch_fix, content)
 
 def add_missing_using(content, filepath):
     """Add missing using directives"""
-    lines = content.split('\n')
-    using_lines = [line for line in lines if line.strip().startswith('using ')]
+    present = set(_RE_MODELS_SUB_USING.findall(content))
 
     # Check what's needed
-    needs_roslyn = 'CallerResult' in content or 'CallType' in content or 'ConfidenceLevel' in content
-    needs_streaming = 'StreamProcessRequest' in content or 'StreamProcessorType' in content
-    needs_analyzers = 'AnalyzerLoadResult' in content or 'IAnalyzerRegistry' in content
-
-    has_roslyn = any('MCPsharp.Models.Roslyn' in line for line in using_lines)
-    has_streaming = any('MCPsharp.Models.Streaming' in line for line in using_lines)
-    has_analyzers = any('MCPsharp.Models.Analyzers' in line for line in using_lines)
-
-    # Add missing using statements
-    if needs_roslyn and not has_roslyn:
-        for i, line in enumerate(lines):
-            if line.strip().startswith('using MCPsharp.Models;'):
-                lines.insert(i + 1, 'using MCPsharp.Models.Roslyn;')
-                break
-
-    if needs_streaming and not has_streaming:
-        for i, line in enumerate(lines):
-            if line.strip().startswith('using MCPsharp.Models;'):
-                lines.insert(i + 1, 'using MCPsharp.Models.Streaming;')
-                break
-
-    if needs_analyzers and not has_analyzers:
-        for i, line in enumerate(lines):
-            if line.strip().startswith('using MCPsharp.Models;'):
-                lines.insert(i + 1, 'using MCPsharp.Models.Analyzers;')
-                break
-
-    return '\n'.join(lines)
-
-def fix_method_signature_accessibility(content):
-    """Add Accessibility property to MethodSignature if missing"""
-    # Pattern to find MethodSignature initializations
-    pattern = r'(Name\s*=\s*"[^"]+",\s*ContainingType\s*=\s*"[^"]+",\s*ReturnType\s*=\s*"[^"]+",)'
-    replacement = r'\1\n                Accessibility = "public",'
-    return re.sub(pattern, replacement, content, flags=re.MULTILINE)
-
-def fix_caller_result_properties(content):
-    """Fix CallerResult property accesses"""
-    content = content.replace('result.MethodName', 'result.TargetSignature.Name')
-    content = content.replace('result.ContainingType', 'result.TargetSignature.ContainingType')
-    return content
-
-def fix_analyzer_registry_methods(content):
-    """Fix analyzer registry method calls"""
-    content = content.replace('.UnregisterAnalyzer', '.UnregisterAnalyzerAsync')
-    content = content.replace('.UnloadAnalyzer', '.UnloadAnalyzerAsync')
-    content = content.replace('.LoadAnalyzer', '.LoadAnalyzerAsync')
-    content = content.replace('.RunAnalyzer', '.RunAnalyzerAsync')
-    content = content.replace('.ValidateAnalyzer', '.ValidateAnalyzerAsync')
-    return content
-
-def fix_common_issues(content):
-    """Fix other common issues"""
-    # Fix SecurityValidationResult
-    content = re.sub(
-        r'new SecurityValidationResult\(\s*\{\s*IsValid\s*=\s*true\s*\}',
-        'new SecurityValidationResult { IsValid = true, IsSigned = false, IsTrusted = false, HasMaliciousPatterns = false }',
-        content
-    )
+    needs_roslyn = b'CallerResult' in content or b'CallType' in content or b'ConfidenceLevel' in content
+    needs_streaming = b'StreamProcessRequest' in content or b'StreamProcessorType' in content
+    needs_analyzers = b'AnalyzerLoadResult' in content or b'IAnalyzerRegistry' in content
+
+    missing = []
+    if needs_analyzers and b'Analyzers' not in present:
+        missing.append(b'using MCPsharp.Models.Analyzers;')
+    if needs_streaming and b'Streaming' not in present:
+        missing.append(b'using MCPsharp.Models.Streaming;')
+    if needs_roslyn and b'Roslyn' not in present:
+        missing.append(b'using MCPsharp.Models.Roslyn;')
+
+    if not missing:
+        return content
+
+    def insert_after(match):
+        # Reuse the anchor line's ending; at end of file there is none to reuse
+        eol = match.group(1)
+        if eol:
+            return match.group(0) + b''.join(line + eol for line in missing)
+        return match.group(0) + b''.join(b'\n' + line for line in missing)
+
+    # Add missing using statements directly after the first 'using MCPsharp.Models;'
+    return _RE_MODELS_USING.sub(insert_after, content, count=1)
+
+def _walk_cs(root):
+    """Yield the path of every .cs file under root"""
+    if not os.path.isdir(root):
+        return
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith('.cs'):
+                    yield entry.path
+
+def _write_atomic(filepath, content):
+    """Replace filepath with content without ever leaving it half-written"""
+    tmp_path = f"{filepath}.tmp.{os.getpid()}"
+    try:
+        # One large buffered write, then an atomic rename over the original
+        with open(tmp_path, 'wb', buffering=1 << 20) as f:
+            f.write(content)
+        shutil.copymode(filepath, tmp_path)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _process_one(filepath):
+    """Fix a single test file, returning True if it was rewritten"""
+    try:
+        # C# sources are rewritten as raw bytes; none of the fixes need decoded text.
+        # Scan the page cache through mmap first, so files without any trigger
+        # substring are never copied into memory or touched by the regex engine
+        # (mmap's 'in' only tests single bytes, hence find())
+        with open(filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return False
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                needs_fixes = any(mapped.find(trigger) != -1 for trigger in _FIX_TRIGGERS)
+                needs_usings = mapped.find(b'using MCPsharp.Models;') != -1 and any(mapped.find(trigger) != -1 for trigger in _USING_TRIGGERS)
+                if not needs_fixes and not needs_usings:
+                    return False
+                content = mapped[:]
+
+        original_content = content
+
+        # Apply fixes
+        if needs_fixes:
+            content = apply_fixes(content)
+        if needs_usings:
+            content = add_missing_using(content, filepath)
 
-    # Fix ProcessFileAsync calls that still have old signature
-    content = re.sub(
-        r'(\w+)\.ProcessFileAsync\(([^,]+),\s*([^)]+)\)',
-        r'\1.ProcessFileAsync(\2)',
-        content
-    )
+        # Write back if changed. re.sub and bytes.replace hand back the same
+        # object when nothing matched, so the identity test settles the common
+        # no-op case without comparing the whole buffer
+        if content is not original_content and content != original_content:
+            _write_atomic(filepath, content)
+            return True
+
+    except Exception as e:
+        print(f"Error processing {filepath}: {e}")
 
-    return content
+    return False
 
 def main():
     print("Starting batch fix of MCPsharp test compilation errors...")
 
     # Find all C# test files
-    test_files = []
-    for pattern in ['tests/**/*.cs', 'tests\\**\\*.cs']:
-        test_files.extend(glob.glob(pattern, recursive=True))
+    test_files = list(_walk_cs('tests'))
 
     print(f"Found {len(test_files)} test files")
 
-    fixed_count = 0
-
-    for filepath in test_files:
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            original_content = content
+    # Files are independent, so spread the regex work across processes;
+    # for a handful of files the pool startup costs more than it saves
+    if len(test_files) < _MIN_PARALLEL_FILES:
+        results = [_process_one(filepath) for filepath in test_files]
+    else:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = list(executor.map(_process_one, test_files, chunksize=16))
 
-            # Apply fixes
-            content = fix_list_length_to_count(content)
-            content = fix_is_analyzer_loaded(content)
-            content = fix_error_property(content)
-            content = add_missing_using(content, filepath)
-            content = fix_method_signature_accessibility(content)
-            content = fix_caller_result_properties(content)
-            content = fix_analyzer_registry_methods(content)
-            content = fix_common_issues(content)
-
-            # Write back if changed
-            if content != original_content:
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                fixed_count += 1
-                print(f"Fixed: {filepath}")
-
-        except Exception as e:
-            print(f"Error processing {filepath}: {e}")
+    fixed_count = 0
+    for filepath, fixed in zip(test_files, results):
+        if fixed:
+            fixed_count += 1
+            print(f"Fixed: {filepath}")
 
     print(f"\nBatch fix completed! Fixed {fixed_count} files.")
     print("Run 'dotnet build' to see remaining errors.")
@@ -0,0 +1,229 @@
+"""
+Shared helpers for the CS1998 fixer scripts. All five scripts find their
+warnings through get_cs1998_warnings(), which parses the one cached build
+from run_build_cached(); a fixer that rewrites a file drops the cache, so its
+verification pass always rebuilds.
+Patterns are compiled once at import time. Sources are handled as bytes: every
+token of interest is ASCII, so files are never decoded and round-trip exactly.
+The scripts that still work on decoded text use the *_TEXT twins, compiled from
+the same pattern source.
+"""
+
+import os
+import re
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import AnyStr, Callable, Iterable, Iterator, List, Tuple
+
+# Matched per build-log line. The path may not contain '(', so the scan of a
+# non-warning line gives up at its first parenthesis instead of its last character
+RE_CS1998 = re.compile(rb'\s*([^\s(][^(]*?\.cs)\((\d+),\d+\): warning CS1998:')
+RE_ASYNC = re.compile(rb'\basync\s+')
+# Leftmost Task<T>/ValueTask<T> (groups 1-2) or plain Task (group 3), classified in one scan
+RE_RETURN_TYPE = re.compile(rb'\b(?:(ValueTask|Task)<(.+?)>|(Task)\s)')
+RE_BARE_RETURN = re.compile(rb'\breturn\s*;')
+
+_RE_STATEMENT_PUNCT = re.compile(rb'[()\[\]{};]')
+_RE_STATEMENT_PUNCT_TEXT = re.compile(r'[()\[\]{};]')
+
+# Nesting change for each bracket the statement scan stops at, keyed for both
+# bytes and str sources; ';' is the only other token
+_DEPTH_CHANGE = {b'(': 1, b'[': 1, b'{': 1, b')': -1, b']': -1, b'}': -1}
+_DEPTH_CHANGE.update({token.decode('ascii'): change for token, change in list(_DEPTH_CHANGE.items())})
+
+# Interpolation hole, which may itself hold regular string literals
+_CS_HOLE = rb'\{(?:[^{}"]|"(?:\\.|[^"\\\n])*")*\}'
+
+# Comments and string/char literals, consumed whole so nothing inside them
+# is mistaken for code. Raw ("""...""") and interpolated ($"...", $@"...")
+# strings come first so their quotes and holes are never split up
+CS_SKIP = (
+    rb'//[^\n]*'
+    rb'|/\*.*?\*/'
+    rb'|\$*(?P<raw>"{3,}).*?(?P=raw)'
+    rb'|(?:\$@|@\$)"(?:""|\{\{|' + _CS_HOLE + rb'|[^"{])*"'
+    rb'|\$"(?:\\.|\{\{|' + _CS_HOLE + rb'|[^"\\{\n])*"'
+    rb'|@"(?:[^"]|"")*"'
+    rb'|"(?:\\.|[^"\\\n])*"'
+    rb"|'(?:\\.|[^'\\\n])*'"
+)
+RE_SKIP = re.compile(CS_SKIP, re.DOTALL)
+RE_NOT_NEWLINE = re.compile(rb'[^\n]')
+
+# The same lexer for the scripts that work on decoded text; CS_SKIP is pure ASCII
+RE_SKIP_TEXT = re.compile(CS_SKIP.decode('ascii'), re.DOTALL)
+RE_NOT_NEWLINE_TEXT = re.compile(r'[^\n]')
+
+# Below this many files, worker start-up costs more than it saves
+MIN_PARALLEL_FILES = 8
+
+# Repository root, resolved once for the build's working directory and for reporting
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Build warnings log shared between scripts, relative to the repository root
+BUILD_CACHE = '.cs1998-warnings.txt'
+
+# No telemetry, and no MSBuild nodes left running between the scripts' builds
+_BUILD_ENV = {**os.environ, 'DOTNET_CLI_TELEMETRY_OPTOUT': '1', 'MSBUILDDISABLENODEREUSE': '1'}
+
+def _latest_source_mtime(root: Path) -> float:
+    """Newest modification time of any .cs file under root."""
+    latest = 0.0
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in ('bin', 'obj', '.git'):
+                        stack.append(entry.path)
+                elif entry.name.endswith('.cs'):
+                    latest = max(latest, entry.stat().st_mtime)
+    return latest
+
+def run_build_cached(cache_path: str = BUILD_CACHE, max_age: float = 60) -> Iterator[bytes]:
+    """
+    Yield the warnings of a full build line by line as bytes, caching them.
+    The cached log is reused while it is younger than max_age seconds and
+    strictly newer than every .cs file, so the scripts can share a single build.
+    """
+    cache = REPO_ROOT / cache_path
+    try:
+        cached_at = cache.stat().st_mtime
+    except FileNotFoundError:
+        cached_at = None
+
+    # Strictly newer: a source edited in the same timestamp tick as the cache
+    # was written must still force a rebuild
+    if not (cached_at is not None
+            and time.time() - cached_at <= max_age
+            and cached_at > _latest_source_mtime(REPO_ROOT)):
+        # Build into a temporary log so an interrupted or stale build never
+        # leaves a partial cache behind
+        partial = cache.with_name(cache.name + '.tmp')
+        partial.unlink(missing_ok=True)
+
+        # Warnings go to a small file log instead of the console, so only
+        # diagnostics have to be read back and scanned. Projects build in parallel;
+        # analyzers are skipped because CS1998 comes from the compiler itself.
+        # Every file is recompiled: an up-to-date project would report no warnings
+        subprocess.run(
+            ['dotnet', 'build', '--no-incremental', '-nologo', '-m', '-nodeReuse:false',
+             '-p:RunAnalyzersDuringBuild=false', '-noConsoleLogger',
+             f'-flp:logfile={partial.relative_to(REPO_ROOT)};warningsonly;NoSummary'],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.STDOUT,
+            cwd=REPO_ROOT,
+            env=_BUILD_ENV
+        )
+        try:
+            os.replace(partial, cache)
+        except FileNotFoundError:
+            return
+
+    with open(cache, 'rb') as f:
+        yield from f
+
+def invalidate_build_cache(cache_path: str = BUILD_CACHE) -> None:
+    """Drop the cached build log; called whenever a fixer rewrites a source file."""
+    (REPO_ROOT / cache_path).unlink(missing_ok=True)
+
+def parse_cs1998_warnings(lines: Iterable[bytes]) -> List[Tuple[str, int]]:
+    """(file, line) of every distinct CS1998 warning in build output lines, in order."""
+    seen = set()
+    warnings = []
+
+    # Only the captured paths are decoded
+    for line in lines:
+        match = RE_CS1998.match(line)
+        if not match:
+            continue
+        key = (match.group(1).decode('utf-8'), int(match.group(2)))
+        if key not in seen:
+            seen.add(key)
+            warnings.append(key)
+
+    return warnings
+
+def get_cs1998_warnings() -> List[Tuple[str, int]]:
+    """Get all CS1998 warnings from build output."""
+    return parse_cs1998_warnings(run_build_cached())
+
+def read_cs_file(file_path: str) -> bytes:
+    """Read a source file as raw bytes."""
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+def write_cs_file(file_path: str, content: bytes) -> None:
+    """Write a source file as raw bytes."""
+    with open(file_path, 'wb') as f:
+        f.write(content)
+    invalidate_build_cache()
+
+def line_offsets(content: bytes) -> List[int]:
+    """Offset of the start of every line, so line numbers index straight into content."""
+    offsets = [0] if content else []
+    i = content.find(b'\n')
+    while i != -1 and i + 1 < len(content):
+        offsets.append(i + 1)
+        i = content.find(b'\n', i + 1)
+    return offsets
+
+def mask_literals(text: bytes) -> bytes:
+    """Blank out comments and literals, keeping offsets and newlines intact."""
+    return RE_SKIP.sub(lambda m: RE_NOT_NEWLINE.sub(b' ', m.group(0)), text)
+
+def mask_literals_text(text: str) -> str:
+    """mask_literals for decoded source text."""
+    return RE_SKIP_TEXT.sub(lambda m: RE_NOT_NEWLINE_TEXT.sub(' ', m.group(0)), text)
+
+def find_statement_end(masked: AnyStr, start: int) -> int:
+    """Offset of the ';' ending the statement that continues at start, or -1."""
+    punct = _RE_STATEMENT_PUNCT if isinstance(masked, bytes) else _RE_STATEMENT_PUNCT_TEXT
+    depth = 0
+    for match in punct.finditer(masked, start):
+        change = _DEPTH_CHANGE.get(match.group(0))
+        if change is not None:
+            depth += change
+        elif depth == 0:
+            return match.start()
+    return -1
+
+def find_method_end(content: bytes, start: int) -> int:
+    """Find the index of the ending brace of a method."""
+    # Jump between braces with str.find instead of visiting every character
+    brace_count = 0
+    i = content.find(b'{', start)
+    close = -1
+
+    while i != -1:
+        if close < i:
+            close = content.find(b'}', i)
+            if close == -1:
+                break
+        open_idx = content.find(b'{', i, close)
+        if open_idx != -1:
+            brace_count += 1
+            i = open_idx + 1
+        else:
+            brace_count -= 1
+            if brace_count == 0:
+                return close
+            i = close + 1
+
+    return len(content) - 1
+
+def fix_files(fixer: Callable[[str, List[int]], List[Tuple[int, bool]]],
+              files: List[Tuple[str, List[int]]]) -> List[List[Tuple[int, bool]]]:
+    """
+    Run fixer(file_path, line_numbers) for every file, in worker processes once
+    there are enough files. Results come back in the order of files.
+    """
+    if len(files) < MIN_PARALLEL_FILES:
+        return [fixer(file_path, line_numbers) for file_path, line_numbers in files]
+
+    paths = [file_path for file_path, _ in files]
+    line_lists = [line_numbers for _, line_numbers in files]
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return list(executor.map(fixer, paths, line_lists))
@@ -4,40 +4,21 @@ Bulk fix CS1998 warnings by removing async and using Task.FromResult.
 """
 
 import re
-import subprocess
 from pathlib import Path
 from collections import defaultdict
 
-def get_cs1998_warnings():
-    """Get all CS1998 warnings."""
-    result = subprocess.run(
-        ['dotnet', 'build', '--no-incremental'],
-        capture_output=True,
-        text=True,
-        cwd='/Users/jas88/Developer/Github/MCPsharp'
-    )
-
-    warnings = []
-    pattern = r'(.+\.cs)\((\d+),(\d+)\): warning CS1998:'
-
-    output = result.stdout + result.stderr
-    for line in output.split('\n'):
-        match = re.search(pattern, line)
-        if match:
-            file_path = match.group(1)
-            line_num = int(match.group(2))
-            if (file_path, line_num) not in warnings:  # Deduplicate
-                warnings.append((file_path, line_num))
-
-    return warnings
+from _cs1998_common import get_cs1998_warnings, invalidate_build_cache
+
+_RE_ASYNC = re.compile(r'\basync\s+')
 
 def fix_file(file_path, line_nums):
     """Fix all async methods in a file."""
     with open(file_path, 'r') as f:
         lines = f.readlines()
 
-    # Sort line numbers in reverse to maintain indices
-    for line_num in sorted(set(line_nums), reverse=True):
+    # Each edit stays on its own line, so line numbers never shift
+    changed = False
+    for line_num in set(line_nums):
         idx = line_num - 1
         if idx < 0 or idx >= len(lines):
             continue
@@ -47,11 +28,14 @@ def fix_file(file_path, line_nums):
         # Remove 'async ' from method signature
         if 'async ' in line:
             # Pattern: public/private/protected/internal async Task
-            lines[idx] = re.sub(r'\basync\s+', '', line)
+            lines[idx] = _RE_ASYNC.sub('', line)
+            changed = True
 
-    # Write back
-    with open(file_path, 'w') as f:
-        f.writelines(lines)
+    # Write back in a single call, and only if something was removed
+    if changed:
+        with open(file_path, 'w') as f:
+            f.write(''.join(lines))
+        invalidate_build_cache()
 
 def find_return_statements(file_path):
     """Find and fix return statements to use Task.FromResult."""
@@ -70,8 +54,7 @@ def find_return_statements(file_path):
 
 def main():
     print("Getting CS1998 warnings...")
-    warnings = get_cs1998_warnings()
-    unique_warnings = list(set(warnings))
+    unique_warnings = get_cs1998_warnings()
     print(f"Found {len(unique_warnings)} unique warnings")
 
     # Group by file
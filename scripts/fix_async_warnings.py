@@ -5,33 +5,16 @@ Identifies methods that should be synchronous and converts them.
 """
 
 import re
-import subprocess
 import sys
 from pathlib import Path
 from collections import defaultdict
 
-def get_cs1998_warnings():
-    """Get all CS1998 warnings from build output."""
-    result = subprocess.run(
-        ['dotnet', 'build', '--no-incremental'],
-        capture_output=True,
-        text=True,
-        cwd='/Users/jas88/Developer/Github/MCPsharp'
-    )
-
-    warnings = []
-    pattern = r'(.+\.cs)\((\d+),(\d+)\): warning CS1998:'
-
-    # Check both stdout and stderr
-    output = result.stdout + result.stderr
-    for line in output.split('\n'):
-        match = re.search(pattern, line)
-        if match:
-            file_path = match.group(1)
-            line_num = int(match.group(2))
-            warnings.append((file_path, line_num))
-
-    return warnings
+from _cs1998_common import get_cs1998_warnings, mask_literals_text
+
+
+# Scanned over masked source, so braces and 'await' inside comments and
+# literals are never mistaken for code
+_RE_TOKENS = re.compile(r'[{}]|(?P<await>\bawait\b)')
 
 def analyze_method(file_path, line_num):
     """Check if a method actually uses await."""
@@ -48,31 +31,29 @@ def analyze_method(file_path, line_num):
         method_line = lines[start_line].strip()
 
         # Find method body boundaries
+        window = ''.join(lines[start_line:start_line + 200])
         brace_count = 0
         in_method = False
-        method_body = []
-
-        for i in range(start_line, min(len(lines), start_line + 200)):
-            line = lines[i]
-            method_body.append(line)
-
-            for char in line:
-                if char == '{':
-                    brace_count += 1
-                    in_method = True
-                elif char == '}':
-                    brace_count -= 1
-                    if in_method and brace_count == 0:
-                        # Method ended
-                        method_text = ''.join(method_body)
-                        has_await = 'await ' in method_text
-                        return {
-                            'file': file_path,
-                            'line': line_num,
-                            'signature': method_line,
-                            'has_await': has_await,
-                            'body_lines': len(method_body)
-                        }
+        has_await = False
+
+        for match in _RE_TOKENS.finditer(mask_literals_text(window)):
+            token = match.group(0)
+            if token == '{':
+                brace_count += 1
+                in_method = True
+            elif token == '}':
+                brace_count -= 1
+                if in_method and brace_count == 0:
+                    # Method ended
+                    return {
+                        'file': file_path,
+                        'line': line_num,
+                        'signature': method_line,
+                        'has_await': has_await,
+                        'body_lines': window.count('\n', 0, match.start()) + 1
+                    }
+            elif match.lastgroup == 'await':
+                has_await = True
 
         return None
     except Exception as e:
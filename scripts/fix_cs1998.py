@@ -6,123 +6,94 @@ Uses Task.FromResult() for methods that need to maintain Task<T> interface.
 """
 
 import re
-import subprocess
 import sys
 from pathlib import Path
 from typing import Dict, List, Tuple
 
-def get_cs1998_warnings() -> List[Tuple[str, int]]:
-    """Get all CS1998 warnings from build output."""
-    result = subprocess.run(
-        ['dotnet', 'build'],
-        capture_output=True,
-        text=True,
-        cwd=Path(__file__).parent.parent
-    )
-
-    output = result.stdout + result.stderr
-    warnings = []
-    pattern = r'(.+\.cs)\((\d+),\d+\): warning CS1998:'
-
-    for match in re.finditer(pattern, output):
-        file_path = match.group(1)
-        line_num = int(match.group(2))
-        if (file_path, line_num) not in warnings:
-            warnings.append((file_path, line_num))
-
-    return warnings
-
-def find_method_body(lines: List[str], start_idx: int) -> Tuple[int, int, List[str]]:
-    """Find the method body boundaries and return statements."""
-    brace_count = 0
-    found_brace = False
-    end_idx = start_idx
-    return_statements = []
-    in_string = False
-    in_char = False
-    in_single_comment = False
-    in_multi_comment = False
-    escape_next = False
-
-    for i in range(start_idx, min(start_idx + 200, len(lines))):
-        line = lines[i]
-
-        # Simple state tracking for strings/comments (not perfect but better than nothing)
-        for j, char in enumerate(line):
-            if escape_next:
-                escape_next = False
-                continue
-
-            if char == '\\' and (in_string or in_char):
-                escape_next = True
-                continue
-
-            # Track multi-line comments
-            if not in_string and not in_char and not in_single_comment:
-                if j < len(line) - 1 and line[j:j+2] == '/*':
-                    in_multi_comment = True
-                    continue
-                if in_multi_comment and j < len(line) - 1 and line[j:j+2] == '*/':
-                    in_multi_comment = False
-                    continue
-
-            # Track single-line comments
-            if not in_string and not in_char and not in_multi_comment:
-                if j < len(line) - 1 and line[j:j+2] == '//':
-                    in_single_comment = True
-                    break
-
-            if in_single_comment or in_multi_comment:
-                continue
-
-            # Track strings
-            if char == '"' and not in_char:
-                in_string = not in_string
-                continue
-
-            # Track character literals
-            if char == "'" and not in_string:
-                in_char = not in_char
-                continue
+from _cs1998_common import (
+    find_statement_end,
+    get_cs1998_warnings,
+    invalidate_build_cache,
+    mask_literals_text,
+)
+
+_RE_ASYNC = re.compile(r'\basync\s+')
+_RE_TASK_T = re.compile(r'Task<(.+?)>')
+_RE_VALUE_TASK_T = re.compile(r'ValueTask<(.+?)>')
+
+_RE_BRACE = re.compile(r'[{}]')
+_RE_RETURN_KEYWORD = re.compile(r'\breturn\b')
+
+# Characters of masked source examined per bytes-count step when matching braces
+_BRACE_CHUNK = 4096
+
+# Replacement templates, filled with a single str formatting call per return
+_FROM_RESULT_TEMPLATE = 'return Task.FromResult(%s);'
+_COMPLETED_TASK_RETURN = 'return Task.CompletedTask;'
+
+def _find_closing_brace(masked: str, open_idx: int) -> int:
+    """Return the offset of the brace closing the one at open_idx, or -1."""
+    depth = 0
+    pos = open_idx
+    end_of_text = len(masked)
+    while pos < end_of_text:
+        end = min(pos + _BRACE_CHUNK, end_of_text)
+        closes = masked.count('}', pos, end)
+        if closes < depth:
+            # Depth cannot reach zero inside this chunk, so skip it using counts alone
+            depth += masked.count('{', pos, end) - closes
+        else:
+            for match in _RE_BRACE.finditer(masked, pos, end):
+                if match.group(0) == '{':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return match.start()
+        pos = end
+    return -1
+
+def find_method_body(lines: List[str], start_idx: int) -> Tuple[int, int, List[Tuple[int, int, int]]]:
+    """
+    Find the method body boundaries and return statements. Each return is given as
+    (return offset, value offset, ';' offset) into the text of lines start_idx onwards.
+    """
+    window_lines = lines[start_idx:start_idx + 200]
+    window = ''.join(window_lines)
+    masked = mask_literals_text(window)
+
+    body_start = masked.find('{')
+    if body_start == -1:
+        return start_idx, start_idx, []
+
+    body_end = _find_closing_brace(masked, body_start)
+    if body_end == -1:
+        body_end = len(masked)
+        end_idx = start_idx + len(window_lines) - 1
+    else:
+        end_idx = start_idx + masked.count('\n', 0, body_end)
 
-            # Count braces only when not in strings/comments
-            if not in_string and not in_char:
-                if char == '{':
-                    found_brace = True
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-
-        # Reset single-line comment state at end of line
-        in_single_comment = False
-
-        if found_brace and brace_count > 0:
-            # Look for return statements - match both "return value;" and bare "return;"
-            return_match = re.search(r'\breturn\s+(.+?);', line)
-            bare_return_match = re.search(r'\breturn\s*;', line)
-
-            if return_match:
-                return_value = return_match.group(1).strip()
-                return_statements.append((i, return_value))
-            elif bare_return_match:
-                # Add bare return statements with empty string as value
-                return_statements.append((i, ''))
-
-        if found_brace and brace_count == 0:
-            end_idx = i
+    # Returns are located in the masked window, so a 'return' or ';' inside a
+    # string, char or comment is never mistaken for code
+    return_statements = []
+    pos = body_start
+    for match in _RE_RETURN_KEYWORD.finditer(masked, body_start, body_end):
+        if match.start() < pos:
+            continue  # Inside an expression already consumed, e.g. a lambda
+        semicolon = find_statement_end(masked, match.end())
+        if semicolon == -1 or semicolon > body_end:
             break
+        return_statements.append((match.start(), match.end(), semicolon))
+        pos = semicolon + 1
 
     return start_idx, end_idx, return_statements
 
-def fix_async_method(file_path: str, line_num: int) -> bool:
+def fix_async_method(lines: List[str], line_num: int) -> bool:
     """
     Fix a single async method by removing async and wrapping returns with Task.FromResult().
-    Returns True if fixed, False if manual intervention needed.
+    Edits lines in place. Returns True if fixed, False if manual intervention needed.
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-
         if line_num < 1 or line_num > len(lines):
             return False
 
@@ -132,43 +103,46 @@ def fix_async_method(file_path: str, line_num: int) -> bool:
         if 'async' not in original_line:
             return False
 
-        # Remove async keyword
-        fixed_line = re.sub(r'\basync\s+', '', original_line)
-
         # Determine if this returns Task<T> or Task
-        task_match = re.search(r'Task<(.+?)>', original_line)
-        value_task_match = re.search(r'ValueTask<(.+?)>', original_line)
+        task_match = _RE_TASK_T.search(original_line)
+        value_task_match = _RE_VALUE_TASK_T.search(original_line)
         returns_task_t = task_match or value_task_match
         returns_plain_task = 'Task ' in original_line and not returns_task_t
 
         # Find method body and return statements
         _, end_idx, return_statements = find_method_body(lines, line_idx)
+        method = ''.join(lines[line_idx:end_idx + 1])
+
+        # Splice each rewritten return in by offset, so the whole statement is
+        # replaced however many lines or literal semicolons it spans
+        pieces = []
+        pos = 0
+        for return_start, value_start, semicolon in return_statements:
+            ret_value = method[value_start:semicolon].strip()
+
+            # If returns Task<T>, wrap all return values with Task.FromResult()
+            if returns_task_t:
+                if not ret_value or 'Task.FromResult' in ret_value:
+                    continue
+                replacement = _FROM_RESULT_TEMPLATE % ret_value
+
+            # If returns plain Task with no return value, convert "return;" to "return Task.CompletedTask;"
+            elif returns_plain_task and not ret_value:
+                replacement = _COMPLETED_TASK_RETURN
+            else:
+                continue
+
+            pieces.append(method[pos:return_start])
+            pieces.append(replacement)
+            pos = semicolon + 1
+        pieces.append(method[pos:])
 
-        # Update the method signature
-        lines[line_idx] = fixed_line
-
-        # If returns Task<T>, wrap all return values with Task.FromResult()
-        if returns_task_t:
-            for ret_idx, ret_value in reversed(return_statements):
-                if 'Task.FromResult' not in lines[ret_idx]:
-                    old_return = lines[ret_idx]
-                    new_return = re.sub(
-                        r'\breturn\s+(.+?);',
-                        r'return Task.FromResult(\1);',
-                        old_return
-                    )
-                    lines[ret_idx] = new_return
-
-        # If returns plain Task with no return value, convert "return;" to "return Task.CompletedTask;"
-        elif returns_plain_task:
-            for ret_idx, ret_value in reversed(return_statements):
-                old_return = lines[ret_idx]
-                if re.match(r'\s*return\s*;', old_return):
-                    new_return = re.sub(r'\breturn\s*;', 'return Task.CompletedTask;', old_return)
-                    lines[ret_idx] = new_return
-
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
+        # Remove async keyword; returns always follow it, so their offsets were unaffected
+        new_lines = ''.join(pieces).splitlines(keepends=True)
+        new_lines[0] = _RE_ASYNC.sub('', new_lines[0])
+
+        # Lines are only replaced once every edit is built, so a failure leaves them untouched
+        lines[line_idx:end_idx + 1] = new_lines
 
         return True
 
@@ -176,6 +150,33 @@ def fix_async_method(file_path: str, line_num: int) -> bool:
         print(f"  ✗ Error: {e}")
         return False
 
+def fix_async_methods_in_file(file_path: str, line_numbers: List[int]) -> List[Tuple[int, bool]]:
+    """
+    Fix every warned method in one file with a single read and a single write.
+    Returns (line number, fixed) for each warning.
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        # Nothing to fix if the file has no async methods at all
+        if 'async' not in content:
+            return [(line_num, False) for line_num in line_numbers]
+
+        lines = content.splitlines(keepends=True)
+        results = [(line_num, fix_async_method(lines, line_num)) for line_num in line_numbers]
+
+        if any(fixed for _, fixed in results):
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(''.join(lines))
+            invalidate_build_cache()
+
+        return results
+
+    except Exception as e:
+        print(f"  ✗ Error: {e}")
+        return [(line_num, False) for line_num in line_numbers]
+
 def main():
     print("🔍 Finding CS1998 warnings...")
     warnings = get_cs1998_warnings()
@@ -208,8 +209,8 @@ def main():
             rel_path = file_path
         print(f"\n📝 {rel_path} ({len(line_numbers)} warnings)")
 
-        for line_num in line_numbers:
-            if fix_async_method(file_path, line_num):
+        for line_num, fixed in fix_async_methods_in_file(file_path, line_numbers):
+            if fixed:
                 total_fixed += 1
                 print(f"  ✓ Line {line_num}")
             else:
@@ -221,7 +222,11 @@ def main():
     print(f"⚠️  Failed: {total_failed}")
     print(f"{'='*60}\n")
 
-    # Rebuild to check remaining warnings
+    if '--verify' not in sys.argv[1:]:
+        print("Run with --verify to rebuild and check for remaining warnings.")
+        return 0
+
+    # Rebuild to check remaining warnings (writing a fix dropped the cache)
     print("🔨 Rebuilding to verify...")
     remaining = get_cs1998_warnings()
 
@@ -4,66 +4,76 @@ Fix CS1998 warnings by adding pragma warning disable with explanatory comments.
 This is the safest approach that doesn't break existing code logic.
 """
 
-import re
-import subprocess
 import sys
 from pathlib import Path
 from typing import Dict, List, Tuple
 
-def get_cs1998_warnings() -> List[Tuple[str, int]]:
-    """Get all CS1998 warnings from build output."""
-    result = subprocess.run(
-        ['dotnet', 'build'],
-        capture_output=True,
-        text=True,
-        cwd=Path(__file__).parent.parent
-    )
-
-    output = result.stdout + result.stderr
-    warnings = []
-    pattern = r'(.+\.cs)\((\d+),\d+\): warning CS1998:'
-
-    for match in re.finditer(pattern, output):
-        file_path = match.group(1)
-        line_num = int(match.group(2))
-        if (file_path, line_num) not in warnings:
-            warnings.append((file_path, line_num))
-
-    return warnings
-
-def add_pragma_disable(file_path: str, line_num: int) -> bool:
-    """Add #pragma warning disable CS1998 before the method."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+from _cs1998_common import (
+    REPO_ROOT,
+    fix_files,
+    get_cs1998_warnings,
+    line_offsets,
+    read_cs_file,
+    write_cs_file,
+)
+
+_PRAGMA = b'#pragma warning disable CS1998 // Async method lacks await (synchronous implementation)'
+
+def add_pragma_disable(content: bytes, offsets: List[int], line_num: int, inserts: Dict[int, bytes]) -> bool:
+    """Queue #pragma warning disable CS1998 before the method in inserts, keyed by offset."""
+    if line_num < 1 or line_num > len(offsets):
+        return False
+
+    line_idx = line_num - 1
+    line_start = offsets[line_idx]
+    line_end = offsets[line_num] if line_num < len(offsets) else len(content)
+    method_line = content[line_start:line_end]
 
-        if line_num < 1 or line_num > len(lines):
-            return False
+    # Check if pragma is already there
+    if line_idx > 0 and content.find(b'pragma warning disable CS1998', offsets[line_idx - 1], line_start) != -1:
+        return True  # Already fixed
 
-        line_idx = line_num - 1
-        method_line = lines[line_idx]
+    # Get indentation
+    indent = len(method_line) - len(method_line.lstrip())
+    indent_str = b' ' * indent
 
-        # Check if pragma is already there
-        if line_idx > 0 and 'pragma warning disable CS1998' in lines[line_idx - 1]:
-            return True  # Already fixed
+    # Insert pragma before the method, ending it the same way as the method line
+    eol = b'\r\n' if method_line.endswith(b'\r\n') else b'\n'
+    inserts[line_start] = indent_str + _PRAGMA + eol
 
-        # Get indentation
-        indent = len(method_line) - len(method_line.lstrip())
-        indent_str = ' ' * indent
+    return True
 
-        # Insert pragma before the method
-        pragma_line = f'{indent_str}#pragma warning disable CS1998 // Async method lacks await (synchronous implementation)\n'
+def add_pragmas_to_file(file_path: str, line_numbers: List[int]) -> List[Tuple[int, bool]]:
+    """Add every pragma for one file with a single read and a single write."""
+    try:
+        content = read_cs_file(file_path)
+        offsets = line_offsets(content)
+
+        inserts: Dict[int, bytes] = {}
+        results = [(line_num, add_pragma_disable(content, offsets, line_num, inserts))
+                   for line_num in line_numbers]
+
+        # Every pragma already in place: leave the file untouched
+        if not inserts:
+            return results
 
-        lines.insert(line_idx, pragma_line)
+        # Emit the file in one pass, splicing each pragma in ahead of its method
+        pieces = []
+        prev = 0
+        for offset in sorted(inserts):
+            pieces.append(content[prev:offset])
+            pieces.append(inserts[offset])
+            prev = offset
+        pieces.append(content[prev:])
 
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
+        write_cs_file(file_path, b''.join(pieces))
 
-        return True
+        return results
 
     except Exception as e:
-        print(f"  ✗ Error: {e}")
-        return False
+        # May run in a worker process, printing ahead of the report, so name the file
+        print(f"  ✗ Error in {file_path}: {e}")
+        return [(line_num, False) for line_num in line_numbers]
 
 def main():
     print("🔍 Finding CS1998 warnings...")
@@ -82,7 +92,8 @@ def main():
             files_dict[file_path] = []
         files_dict[file_path].append(line_num)
 
-    # Sort line numbers in reverse order (fix from bottom to top to preserve line numbers)
+    # Report each file's warnings bottom to top, as fix_cs1998_v2.py does; pragmas are
+    # spliced in by offset, so the order they are added in no longer matters
     for file_path in files_dict:
         files_dict[file_path].sort(reverse=True)
 
@@ -90,15 +101,19 @@ def main():
     total_fixed = 0
     total_failed = 0
 
-    for file_path, line_numbers in sorted(files_dict.items()):
+    # Files are independent, so fix them all first and report afterwards
+    files = sorted(files_dict.items())
+    file_results = fix_files(add_pragmas_to_file, files)
+
+    for (file_path, line_numbers), results in zip(files, file_results):
         try:
-            rel_path = str(Path(file_path).relative_to(Path(__file__).parent.parent))
+            rel_path = str(Path(file_path).resolve().relative_to(REPO_ROOT))
         except ValueError:
             rel_path = file_path
         print(f"\n📝 {rel_path} ({len(line_numbers)} warnings)")
 
-        for line_num in line_numbers:
-            if add_pragma_disable(file_path, line_num):
+        for line_num, fixed in results:
+            if fixed:
                 total_fixed += 1
                 print(f"  ✓ Line {line_num}")
             else:
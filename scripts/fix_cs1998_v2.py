@@ -6,205 +6,130 @@ Handles multi-line return statements correctly.
 """
 
 import re
-import subprocess
 import sys
 from pathlib import Path
-from typing import Dict, List, Tuple
-
-def get_cs1998_warnings() -> List[Tuple[str, int]]:
-    """Get all CS1998 warnings from build output."""
-    result = subprocess.run(
-        ['dotnet', 'build'],
-        capture_output=True,
-        text=True,
-        cwd=Path(__file__).parent.parent
-    )
-
-    output = result.stdout + result.stderr
-    warnings = []
-    pattern = r'(.+\.cs)\((\d+),\d+\): warning CS1998:'
-
-    for match in re.finditer(pattern, output):
-        file_path = match.group(1)
-        line_num = int(match.group(2))
-        if (file_path, line_num) not in warnings:
-            warnings.append((file_path, line_num))
-
-    return warnings
-
-def find_method_end(lines: List[str], start_idx: int) -> int:
-    """Find the ending brace of a method."""
-    brace_count = 0
-    found_start = False
-
-    for i in range(start_idx, len(lines)):
-        line = lines[i]
-        for char in line:
-            if char == '{':
-                brace_count += 1
-                found_start = True
-            elif char == '}':
-                brace_count -= 1
-                if found_start and brace_count == 0:
-                    return i
-
-    return len(lines) - 1
-
-def fix_async_method(file_path: str, line_num: int) -> bool:
+from typing import Dict, List, Optional, Tuple
+
+from _cs1998_common import (
+    RE_ASYNC,
+    RE_BARE_RETURN,
+    RE_RETURN_TYPE,
+    REPO_ROOT,
+    find_method_end,
+    find_statement_end,
+    fix_files,
+    get_cs1998_warnings,
+    line_offsets,
+    mask_literals,
+    read_cs_file,
+    write_cs_file,
+)
+
+# Lookahead only: whitespace after 'return' may be a masked literal
+_RE_RETURN_VALUE = re.compile(rb'\breturn(?=\s)')
+
+# Replacement templates, filled with a single bytes formatting call per return
+_FROM_RESULT_TEMPLATE = b'return Task.FromResult(%s);'
+_COMPLETED_TASK_RETURN = b'return Task.CompletedTask;'
+
+def fix_async_method(content: bytes, masked: bytes, offset: int) -> Optional[Tuple[bytes, bytes]]:
     """
-    Fix async method by removing 'async' and properly handling return statements.
+    Fix the async method whose signature line starts at offset by removing 'async'
+    and properly handling return statements. masked is content with comments and
+    literals blanked out.
+    Returns the updated (content, masked) pair, or None if the method could not be fixed.
+    """
+    line_end = content.find(b'\n', offset)
+    line_end = len(content) if line_end == -1 else line_end + 1
+    original_line = content[offset:line_end]
+
+    if b'async' not in original_line:
+        return None
+
+    # Remove async keyword from method signature
+    signature = RE_ASYNC.sub(b'', original_line)
+
+    # Determine return type
+    return_type = RE_RETURN_TYPE.search(signature)
+    returns_task_t = bool(return_type and return_type.group(2))
+    returns_plain_task = bool(return_type and return_type.group(3))
+
+    # Find method end; a one-line method keeps the rest of its signature line
+    method_end = find_method_end(masked, offset)
+    body_end = max(method_end + 1, line_end)
+
+    # Method body as a single slice of the file, signature line included
+    method_body = signature + content[line_end:body_end]
+    masked_body = mask_literals(method_body)
+
+    # Returns are located in the masked body, so a 'return' or ';' inside a
+    # string, char or comment is never mistaken for code
+    pieces = []
+    pos = 0
+    if returns_task_t:
+        # Wrap all return values with Task.FromResult()
+        for match in _RE_RETURN_VALUE.finditer(masked_body):
+            if match.start() < pos:
+                continue  # Inside an expression already consumed, e.g. a lambda
+            semicolon = find_statement_end(masked_body, match.end())
+            if semicolon == -1:
+                break
+            return_value = method_body[match.end():semicolon].strip()
+            # Check if already wrapped
+            if return_value and b'Task.FromResult' not in return_value:
+                pieces.append(method_body[pos:match.start()])
+                pieces.append(_FROM_RESULT_TEMPLATE % return_value)
+            else:
+                pieces.append(method_body[pos:semicolon + 1])
+            pos = semicolon + 1
+
+    elif returns_plain_task:
+        # Replace bare return with Task.CompletedTask
+        for match in RE_BARE_RETURN.finditer(masked_body):
+            pieces.append(method_body[pos:match.start()])
+            pieces.append(_COMPLETED_TASK_RETURN)
+            pos = match.end()
+
+    if pieces:
+        pieces.append(method_body[pos:])
+        method_body = b''.join(pieces)
+        masked_body = mask_literals(method_body)
+
+    return (content[:offset] + method_body + content[body_end:],
+            masked[:offset] + masked_body + masked[body_end:])
+
+def fix_async_methods_in_file(file_path: str, line_numbers: List[int]) -> List[Tuple[int, bool]]:
+    """
+    Fix every warned method in one file with a single read and a single write.
+    Returns (line number, fixed) for each warning, bottom to top.
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        lines = content.splitlines(keepends=True)
-
-        if line_num < 1 or line_num > len(lines):
-            return False
-
-        line_idx = line_num - 1
-        original_line = lines[line_idx]
-
-        if 'async' not in original_line:
-            return False
-
-        # Remove async keyword from method signature
-        lines[line_idx] = re.sub(r'\basync\s+', '', original_line)
-
-        # Determine return type
-        task_match = re.search(r'Task<(.+?)>', lines[line_idx])
-        value_task_match = re.search(r'ValueTask<(.+?)>', lines[line_idx])
-        returns_task_t = task_match or value_task_match
-        returns_plain_task = 'Task ' in lines[line_idx] and not returns_task_t
-
-        # Find method end
-        method_end = find_method_end(lines, line_idx)
-
-        # Join all lines in method body into single string for processing
-        method_body = ''.join(lines[line_idx:method_end + 1])
-
-        if returns_task_t:
-            # Wrap all return statements with Task.FromResult()
-            # Use a proper state machine to handle strings, chars, and nested braces
-            new_body = []
-            i = 0
-            while i < len(method_body):
-                # Check if we're at a return statement
-                if method_body[i:i+6] == 'return' and (i == 0 or not method_body[i-1].isalnum()):
-                    # Check if next char is whitespace
-                    if i + 6 < len(method_body) and method_body[i+6].isspace():
-                        # Found a return statement - need to find the full expression
-                        return_start = i
-                        i += 6
-
-                        # Skip whitespace
-                        while i < len(method_body) and method_body[i].isspace():
-                            i += 1
-
-                        # Find the semicolon that ends this return statement
-                        # Handle strings, chars, and nested parens/braces/brackets
-                        value_start = i
-                        in_string = False
-                        in_char = False
-                        in_verbatim = False
-                        escape_next = False
-                        paren_depth = 0
-                        brace_depth = 0
-                        bracket_depth = 0
-
-                        while i < len(method_body):
-                            char = method_body[i]
-
-                            if escape_next:
-                                escape_next = False
-                                i += 1
-                                continue
-
-                            if in_verbatim:
-                                if char == '"':
-                                    if i + 1 < len(method_body) and method_body[i+1] == '"':
-                                        i += 2  # Skip escaped quote in verbatim string
-                                        continue
-                                    else:
-                                        in_verbatim = False
-                                i += 1
-                                continue
-
-                            if char == '\\' and (in_string or in_char):
-                                escape_next = True
-                                i += 1
-                                continue
-
-                            if char == '@' and i + 1 < len(method_body) and method_body[i+1] == '"' and not in_string and not in_char:
-                                in_verbatim = True
-                                i += 2
-                                continue
-
-                            if char == '"' and not in_char:
-                                in_string = not in_string
-                                i += 1
-                                continue
-
-                            if char == "'" and not in_string:
-                                in_char = not in_char
-                                i += 1
-                                continue
-
-                            if not in_string and not in_char:
-                                if char == '(':
-                                    paren_depth += 1
-                                elif char == ')':
-                                    paren_depth -= 1
-                                elif char == '{':
-                                    brace_depth += 1
-                                elif char == '}':
-                                    brace_depth -= 1
-                                elif char == '[':
-                                    bracket_depth += 1
-                                elif char == ']':
-                                    bracket_depth -= 1
-                                elif char == ';' and paren_depth == 0 and brace_depth == 0 and bracket_depth == 0:
-                                    # Found the end of the return statement
-                                    return_value = method_body[value_start:i].strip()
-
-                                    # Check if already wrapped
-                                    if 'Task.FromResult' not in return_value:
-                                        new_body.append(f'return Task.FromResult({return_value});')
-                                    else:
-                                        new_body.append(method_body[return_start:i+1])
-
-                                    i += 1
-                                    break
-
-                            i += 1
-                        continue
-
-                new_body.append(method_body[i])
-                i += 1
-
-            method_body = ''.join(new_body)
-
-        elif returns_plain_task:
-            # Replace bare return with Task.CompletedTask
-            method_body = re.sub(
-                r'\breturn\s*;',
-                'return Task.CompletedTask;',
-                method_body
-            )
-
-        # Split back into lines
-        new_lines = method_body.splitlines(keepends=True)
-        lines[line_idx:method_end + 1] = new_lines
-
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
-
-        return True
+        content = original_content = read_cs_file(file_path)
+
+        masked = mask_literals(content)
+
+        offsets = line_offsets(content)
+
+        # Bottom to top, so fixing a method lower in the file never moves the lines above it
+        results = []
+        for line_num in sorted(line_numbers, reverse=True):
+            fixed = None
+            if 1 <= line_num <= len(offsets):
+                fixed = fix_async_method(content, masked, offsets[line_num - 1])
+            if fixed is not None:
+                content, masked = fixed
+            results.append((line_num, fixed is not None))
+
+        # Skip the write when nothing changed; the identity test avoids comparing untouched content
+        if content is not original_content and content != original_content:
+            write_cs_file(file_path, content)
+
+        return results
 
     except Exception as e:
-        print(f"  ✗ Error: {e}")
-        return False
+        # May run in a worker process, printing ahead of the report, so name the file
+        print(f"  ✗ Error in {file_path}: {e}")
+        return [(line_num, False) for line_num in sorted(line_numbers, reverse=True)]
 
 def main():
     print("🔍 Finding CS1998 warnings...")
@@ -227,18 +152,19 @@ def main():
     total_fixed = 0
     total_failed = 0
 
-    for file_path in sorted(files_dict.keys()):
-        line_numbers = files_dict[file_path]
+    # Files are independent, so fix them all first and report afterwards
+    files = sorted(files_dict.items())
+    file_results = fix_files(fix_async_methods_in_file, files)
+
+    for (file_path, line_numbers), results in zip(files, file_results):
         try:
-            rel_path = str(Path(file_path).relative_to(Path(__file__).parent.parent))
+            rel_path = str(Path(file_path).resolve().relative_to(REPO_ROOT))
         except ValueError:
             rel_path = file_path
         print(f"\n📝 {rel_path} ({len(line_numbers)} warnings)")
 
-        # Process warnings in reverse order (bottom to top) to avoid line number shifts
-        # This way, fixing a method lower in the file won't affect line numbers above it
-        for line_num in sorted(line_numbers, reverse=True):
-            if fix_async_method(file_path, line_num):
+        for line_num, fixed in results:
+            if fixed:
                 total_fixed += 1
                 print(f"  ✓ Line {line_num}")
             else: